@@ -1,21 +1,30 @@
 import sys
 import json
 import os
-import math
 import cv2
-import numpy as np
+import torch
 from ultralytics import YOLO
 
+from traffic_core import resolve_weights
+
 MODEL_PATH = os.getenv("YOLO_MODEL", "yolov8n.pt")
+MODEL_WEIGHTS = resolve_weights(MODEL_PATH, "ACCIDENT_YOLO_ENGINE")
 CLOSE_VEHICLE_COUNT_THRESHOLD = 2
 CLOSE_DISTANCE_PIXELS = 80
 
-def center(box):
-    x1, y1, x2, y2 = box
-    return ((x1+x2)/2, (y1+y2)/2)
+# FP16 only on CUDA, and not for ONNX exports: those are FP32 and reject float16 input
+HALF = (os.getenv("HALF", "1") == "1" and torch.cuda.is_available()
+        and not MODEL_WEIGHTS.endswith(".onnx"))
+
+VEHICLE_CLASS_IDS = [2, 5, 7]
 
-def euclidean(a, b):
-    return math.hypot(a[0]-b[0], a[1]-b[1])
+_vehicle_class_id_tensors = {}
+
+def _vehicle_class_ids(device):
+    # Built once per device rather than for every result
+    if device not in _vehicle_class_id_tensors:
+        _vehicle_class_id_tensors[device] = torch.tensor(VEHICLE_CLASS_IDS, device=device)
+    return _vehicle_class_id_tensors[device]
 
 def check_accident_by_model_results(results):
     for r in results:
@@ -24,19 +33,21 @@ def check_accident_by_model_results(results):
                 if cls_name.lower() == "accident":
                     return True, {"reason": "model_accident_class"}
 
-    vehicles = []
+    # Filter and reduce on the results' own device; only the final counts are copied back
+    vehicle_boxes = []
     for r in results:
-        boxes = r.boxes.xyxy.cpu().numpy() if hasattr(r.boxes, "xyxy") else np.array([])
-        classes = r.boxes.cls.cpu().numpy() if hasattr(r.boxes, "cls") else np.array([])
-        for i, b in enumerate(boxes):
-            if int(classes[i]) in [2, 5, 7]:
-                vehicles.append(b.tolist())
-
-    centers = [center(b) for b in vehicles]
-    close_pairs = sum(
-        1 for i in range(len(centers)) for j in range(i+1, len(centers))
-        if euclidean(centers[i], centers[j]) < CLOSE_DISTANCE_PIXELS
-    )
+        if not hasattr(r.boxes, "xyxy") or not hasattr(r.boxes, "cls"):
+            continue
+        cls = r.boxes.cls.long()
+        mask = torch.isin(cls, _vehicle_class_ids(cls.device))
+        vehicle_boxes.append(r.boxes.xyxy[mask])
+    vehicles = torch.cat(vehicle_boxes) if vehicle_boxes else torch.empty((0, 4))
+
+    # Pairwise squared distances between box centers; upper triangle skips self/duplicate pairs
+    centers = (vehicles[:, :2] + vehicles[:, 2:]) * 0.5
+    d2 = ((centers[:, None, :] - centers[None, :, :]) ** 2).sum(-1)
+    i, j = torch.triu_indices(len(centers), len(centers), 1, device=centers.device)
+    close_pairs = int((d2[i, j] < CLOSE_DISTANCE_PIXELS ** 2).sum().item())
 
     if len(vehicles) >= CLOSE_VEHICLE_COUNT_THRESHOLD and close_pairs >= 1:
         return True, {
@@ -47,41 +58,66 @@ def check_accident_by_model_results(results):
 
     return False, {"reason": "no_accident_detected", "vehicle_count": len(vehicles)}
 
-def main():
-    if len(sys.argv) < 2:
-        print(json.dumps({"error": "No image path provided"}))
-        sys.exit(1)
-
-    img_path = sys.argv[1]
+def detect(model, img_path):
+    """Run accident detection on one image and return the JSON-ready response."""
     if not os.path.exists(img_path):
-        print(json.dumps({"error": "Image not found", "path": img_path}))
-        sys.exit(1)
+        return {"error": "Image not found", "path": img_path}
 
+    # Decode here rather than passing the path: uploads are saved without an
+    # extension, which Ultralytics needs to recognise a path as an image
     try:
         img = cv2.imread(img_path)
         if img is None:
             raise ValueError("cv2.imread() failed — invalid image file.")
     except Exception as e:
-        print(json.dumps({"error": "Image read failed", "exception": str(e)}))
-        sys.exit(1)
+        return {"error": "Image read failed", "exception": str(e)}
 
     try:
-        model = YOLO(MODEL_PATH)
+        results = model(img, imgsz=640, half=HALF, verbose=False)  # suppress logs
     except Exception as e:
-        print(json.dumps({"error": "Model load failed", "exception": str(e)}))
-        sys.exit(1)
+        return {"error": "Inference failed", "exception": str(e)}
+
+    accident_detected, info = check_accident_by_model_results(results)
+    return {"accident": accident_detected, "info": info}
 
+def load_model():
     try:
-        results = model(img, imgsz=640, verbose=False)  # suppress logs
+        return YOLO(MODEL_WEIGHTS)
     except Exception as e:
-        print(json.dumps({"error": "Inference failed", "exception": str(e)}))
+        print(json.dumps({"error": "Model load failed", "exception": str(e)}))
         sys.exit(1)
 
-    accident_detected, info = check_accident_by_model_results(results)
+def serve():
+    """Keep the model loaded and answer one JSON line per image path read from stdin."""
+    model = load_model()
+    for line in sys.stdin:
+        img_path = line.strip()
+        if not img_path:
+            continue
+        sys.stdout.write(json.dumps(detect(model, img_path)) + "\n")
+        sys.stdout.flush()
+
+def main():
+    if len(sys.argv) < 2:
+        print(json.dumps({"error": "No image path provided"}))
+        sys.exit(1)
+
+    if sys.argv[1] == "--serve":
+        serve()
+        return
+
+    img_path = sys.argv[1]
+    if not os.path.exists(img_path):
+        print(json.dumps({"error": "Image not found", "path": img_path}))
+        sys.exit(1)
+
+    response = detect(load_model(), img_path)
 
     # Ensure ONLY JSON is printed
-    sys.stdout.write(json.dumps({"accident": accident_detected, "info": info}))
+    sys.stdout.write(json.dumps(response))
     sys.stdout.flush()
+    if "error" in response:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,58 @@
+import os
+import sys
+import json
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from detect_accident import detect, load_model
+
+# Long-running HTTP front end for detect_accident.py: the model is loaded once at
+# startup and every POST /detect reuses it. Requests are handled one at a time,
+# since a single Ultralytics model must not run concurrently.
+HOST = os.getenv("DETECT_HOST", "127.0.0.1")
+PORT = int(os.getenv("DETECT_PORT", "8766"))
+
+class DetectHandler(BaseHTTPRequestHandler):
+    model = None
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        if self.path != "/detect":
+            self._send_json(404, {"error": "Not found", "path": self.path})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            img_path = json.loads(self.rfile.read(length) or b"{}")["path"]
+        except (ValueError, KeyError, TypeError):
+            img_path = None
+        # Anything but a non-empty string would reach os.path.exists/YOLO as-is (0 is a webcam source)
+        if not isinstance(img_path, str) or not img_path:
+            self._send_json(400, {"error": "Expected JSON body with an image \"path\""})
+            return
+
+        response = detect(self.model, img_path)
+        if "error" not in response:
+            status = 200
+        elif response["error"] == "Image not found":
+            status = 404
+        elif response["error"] == "Image read failed":
+            status = 400
+        else:
+            status = 500
+        self._send_json(status, response)
+
+def main():
+    DetectHandler.model = load_model()
+    server = HTTPServer((HOST, PORT), DetectHandler)
+    print(f"Accident detection listening on http://{HOST}:{PORT}/detect", file=sys.stderr, flush=True)
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,23 @@
 # mainAlgo.py
 from ultralytics import YOLO
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import cv2
+import numpy as np
+import torch
 import os
-import pandas as pd
 import csv
-import re
 import json
+import multiprocessing.util
 import sys
 
+from traffic_core import count_vehicles, get_lane1_time, get_vehicle_ids, load_routes, resolve_weights
+
 # =========================
 # Constants for YOLO processing
 # =========================
 MIN_SIGNAL_TIME = 5
 TIME_PER_VEHICLE = 2.5
 
-# =========================
-# Constants for Route Timing
-# =========================
-MAX_SIGNAL_TIME = 60
-BUFFER_TIME = 5
-MIN_GREEN_TIME = 5  # Minimum green signal for fairness
-
 # =========================
 # Paths
 # =========================
@@ -30,36 +27,45 @@ ROUTE_SIGNAL_FILE = os.path.join(BASE_DIR, "routeSignal.csv")
 SUMMARY_OUTPUT = os.path.join(BASE_DIR, "lane1_summary.csv")
 FASTEST_OUTPUT = os.path.join(BASE_DIR, "fastest_route.json")
 
+# Inference resolution; smaller sizes (e.g. 416) are faster but undercount dense lanes
+IMGSZ = int(os.getenv("IMGSZ", "640"))
+if IMGSZ <= 0 or IMGSZ % 32:
+    # YOLOv8's stride is 32; anything else gets silently rounded and won't match an exported engine
+    sys.exit(f"[Error] IMGSZ must be a positive multiple of 32, got {IMGSZ}")
+
+# Worker processes for CPU-only crossing processing (defaults to one per core)
+CROSSING_WORKERS = int(os.getenv("CROSSING_WORKERS", "0")) or os.cpu_count() or 1
+
+# Writing Output/annotated_<lane> images is opt-in; counting doesn't need them
+SAVE_ANNOTATED = os.getenv("SAVE_ANNOTATED", "0") == "1"
+
 # =========================
 # YOLO model setup
 # =========================
+MODEL_PATH = "yolov8m.pt"
+MODEL_WEIGHTS = resolve_weights(MODEL_PATH, "ROUTE_YOLO_ENGINE")
+
+# FP16 only on CUDA, and not for ONNX exports: those are FP32 and reject float16 input
+HALF = (os.getenv("HALF", "1") == "1" and torch.cuda.is_available()
+        and not MODEL_WEIGHTS.endswith(".onnx"))
+
 try:
-    model = YOLO("yolov8m.pt")
-    vehicle_classes = ['car', 'truck', 'bus', 'motorbike', 'bicycle']
+    model = YOLO(MODEL_WEIGHTS)
 except Exception as e:
     model = None
-    vehicle_classes = ['car', 'truck', 'bus', 'motorbike', 'bicycle']
     print("[Warning] YOLO model failed to load. Running limited mode (no detection).", file=sys.stderr)
 
+# Class ids of the vehicle classes in the loaded model; passed to predict so NMS drops everything else
+VEHICLE_CLASS_IDS = get_vehicle_ids(model) if model else []
+
 
 # =========================
 # YOLO Helper Functions
 # =========================
-def count_vehicles(results):
-    """Count only vehicles of interest from YOLO detections."""
-    if model is None:
-        return 0
-    names = model.names
-    count = 0
-    for r in results:
-        for cls in r.boxes.cls:
-            try:
-                label = names[int(cls)]
-            except Exception:
-                continue
-            if label in vehicle_classes:
-                count += 1
-    return count
+def warmup_model():
+    """Run one dummy inference so CUDA/cuDNN setup isn't charged to the first lane."""
+    if model:
+        model.predict(np.zeros((IMGSZ, IMGSZ, 3), dtype=np.uint8), imgsz=IMGSZ, half=HALF, verbose=False)
 
 
 def calculate_signal_time(vehicle_count):
@@ -69,6 +75,45 @@ def calculate_signal_time(vehicle_count):
     return max(MIN_SIGNAL_TIME, int(vehicle_count * TIME_PER_VEHICLE))
 
 
+def predict_lanes(image_paths):
+    """Run lane images through YOLO in one forward pass; returns {absolute image path: result}."""
+    # predict() defaults to batch=1 for file sources, which would mean one pass per lane
+    results = model(image_paths, conf=0.35, imgsz=IMGSZ, half=HALF, batch=len(image_paths),
+                    classes=VEHICLE_CLASS_IDS, verbose=False)
+    return {os.path.abspath(r.path): r for r in results}
+
+
+# Background writer for annotated images, shared by every crossing in this process so
+# writes for one crossing overlap inference on the next. Created on first use so each
+# crossing worker process gets its own threads.
+_annotator = None
+
+
+def get_annotator():
+    global _annotator
+    if _annotator is None:
+        _annotator = ThreadPoolExecutor(max_workers=2)
+    return _annotator
+
+
+def drain_annotator():
+    """Wait for pending annotated image writes in this process."""
+    global _annotator
+    if _annotator is not None:
+        _annotator.shutdown(wait=True)
+        _annotator = None
+
+
+def save_annotated_image(result, image_path, out_path):
+    """Write the lane image with detections drawn (the raw image in limited mode)."""
+    try:
+        annotated_image = result.plot() if result is not None else cv2.imread(image_path)
+        if annotated_image is not None:
+            cv2.imwrite(out_path, annotated_image)
+    except Exception as e:
+        print(f"[Warning] failed to write annotated image: {e}", file=sys.stderr)
+
+
 def process_crossing(crossing_path):
     """Process all lane images inside a crossing folder."""
     lanes_path = os.path.join(crossing_path, "Lanes")
@@ -80,46 +125,54 @@ def process_crossing(crossing_path):
     if not os.path.isdir(lanes_path):
         return data
 
+    # Gather lane image paths so they can go through YOLO as one batch;
+    # Ultralytics decodes the files itself, so nothing is read here.
+    lanes = []
     for lane_img in sorted(os.listdir(lanes_path)):
         if lane_img.lower().endswith(('.png', '.jpg', '.jpeg')):
-            image_path = os.path.join(lanes_path, lane_img)
-            try:
-                image = cv2.imread(image_path)
-                if model:
-                    results = model(image, conf=0.35)
-                    count = count_vehicles(results)
-                    annotated_image = results[0].plot()
-                else:
-                    count = 0
-                    annotated_image = image
-            except Exception as e:
-                print(f"[Error] processing {image_path}: {e}", file=sys.stderr)
-                count = 0
-                annotated_image = None
-
-            signal_time = calculate_signal_time(count)
-
-            # Save annotated image if available
-            try:
-                if annotated_image is not None:
-                    cv2.imwrite(os.path.join(output_path, f"annotated_{lane_img}"), annotated_image)
-            except Exception as e:
-                print(f"[Warning] failed to write annotated image: {e}", file=sys.stderr)
-
-            data.append({
-                "Lane": lane_img,
-                "Vehicle Count": count,
-                "Signal Time (s)": signal_time
-            })
+            lanes.append((lane_img, os.path.join(lanes_path, lane_img)))
+
+    results_by_path = {}
+    if model and lanes:
+        image_paths = [image_path for _, image_path in lanes]
+        try:
+            results_by_path = predict_lanes(image_paths)
+        except Exception as e:
+            # A single unreadable lane fails the whole batch; retry lane by lane so only it is lost
+            print(f"[Error] processing {crossing_path}: {e}", file=sys.stderr)
+            for image_path in image_paths:
+                try:
+                    results_by_path.update(predict_lanes([image_path]))
+                except Exception as e:
+                    print(f"[Error] processing {image_path}: {e}", file=sys.stderr)
 
-            print(f"[{crossing_path}] {lane_img}: {count} vehicles => Signal Time: {signal_time}s", file=sys.stderr)
+    for lane_img, image_path in lanes:
+        result = results_by_path.get(os.path.abspath(image_path))
+        count = count_vehicles([result]) if result is not None else 0
+
+        signal_time = calculate_signal_time(count)
+
+        # Save annotated image if requested; drawing/encoding/writing runs in the background
+        if SAVE_ANNOTATED and (result is not None or not model):
+            get_annotator().submit(save_annotated_image, result, image_path,
+                                   os.path.join(output_path, f"annotated_{lane_img}"))
+
+        data.append({
+            "Lane": lane_img,
+            "Vehicle Count": count,
+            "Signal Time (s)": signal_time
+        })
+
+        print(f"[{crossing_path}] {lane_img}: {count} vehicles => Signal Time: {signal_time}s", file=sys.stderr)
 
     # Save CSV for this crossing
     if data:
-        df = pd.DataFrame(data)
         output_csv_path = os.path.join(output_path, "lane_counts.csv")
         try:
-            df.to_csv(output_csv_path, index=False)
+            with open(output_csv_path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=["Lane", "Vehicle Count", "Signal Time (s)"])
+                writer.writeheader()
+                writer.writerows(data)
             print(f"✅ Saved: {output_csv_path}", file=sys.stderr)
         except Exception as e:
             print(f"[Warning] Failed to write lane_counts.csv for {crossing_path}: {e}", file=sys.stderr)
@@ -127,100 +180,40 @@ def process_crossing(crossing_path):
     return data
 
 
-def get_crossings_from_route_signal(csv_path):
-    """Reads routeSignal.csv and returns a unique list of crossing folder names to process."""
-    try:
-        with open(csv_path, newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            rows = list(reader)
-    except Exception as e:
-        print(f"❌ Error reading {csv_path}: {e}", file=sys.stderr)
-        return []
-    
-    if not rows:
-        print("⚠ routeSignal.csv is empty!", file=sys.stderr)
-        return []
-
-    all_signals = set()
-    for row in rows:
-        signal_numbers_str = row.get("signal_serial_numbers", "").strip().strip('"')
-        if signal_numbers_str:
-            for num in signal_numbers_str.split(";"):
-                num = num.strip()
-                if num:
-                    all_signals.add(f"Crossing_{num}")
-
-    return sorted(all_signals)
-
-
-# =========================
-# Route Timer Helper Functions
-# =========================
-def read_lane_data(file_path):
-    """Read lane_counts.csv and return {lane_name: signal_time}"""
-    lane_data = {}
-    try:
-        with open(file_path, 'r') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                lane_name = row.get('Lane', '').replace('.jpg', '').replace('.png', '').lower()
-                try:
-                    signal_time = int(float(row.get('Signal Time (s)', 0)))
-                except Exception:
-                    signal_time = 0
-                lane_data[lane_name] = signal_time
-    except Exception as e:
-        print(f"[Warning] could not read lane data at {file_path}: {e}", file=sys.stderr)
-    return lane_data
-
-
-def calculate_lane1_time(lane_data):
-    """Calculate total green time for Lane1 considering cycle rules"""
-    lane1_time = lane_data.get("lane1", 0)
-    lanes = sorted(lane_data.keys())
-    other_lanes = {lane: lane_data[lane] for lane in lanes if lane != "lane1"}
-
-    total_time = 0
-    remaining_lane1 = lane1_time
-    remaining_others = other_lanes.copy()
-
-    while remaining_lane1 > MAX_SIGNAL_TIME:
-        total_time += MAX_SIGNAL_TIME
-        remaining_lane1 -= MAX_SIGNAL_TIME
-        total_time += BUFFER_TIME
-
-        for lane in remaining_others:
-            time = min(remaining_others[lane], MAX_SIGNAL_TIME)
-            if time <= 0:
-                time = MIN_GREEN_TIME
-            total_time += time + BUFFER_TIME
-            remaining_others[lane] = max(0, remaining_others[lane] - time)
+def _init_crossing_worker(num_threads):
+    # Split the cores between workers instead of every worker's torch using all of them
+    torch.set_num_threads(num_threads)
+    # Flush this worker's annotated image writes when the pool shuts it down
+    multiprocessing.util.Finalize(None, drain_annotator, exitpriority=10)
 
-    if remaining_lane1 > 0:
-        total_time += remaining_lane1
-
-    return total_time
 
+def process_crossings(crossing_paths):
+    """Process several crossings, spread across CPU cores when inference runs on the CPU."""
+    workers = min(len(crossing_paths), CROSSING_WORKERS)
+    if torch.cuda.is_available():
+        warmup_model()
+    if workers < 2 or torch.cuda.is_available():
+        # A single process keeps the GPU busy with batched calls; extra processes would just contend for it
+        for crossing_path in crossing_paths:
+            process_crossing(crossing_path)
+        drain_annotator()
+        return
 
-def parse_distance_time(distance_time_str):
-    """Extract time in seconds from 'X km / Y min' format"""
-    if not distance_time_str:
-        return 0
-    match = re.search(r'([\d\.]+)\s*min', distance_time_str)
-    if match:
-        try:
-            return float(match.group(1)) * 60.0
-        except Exception:
-            return 0
-    return 0
+    # Each worker gets the module-level model (inherited on fork, reloaded on import otherwise)
+    num_threads = max(1, (os.cpu_count() or 1) // workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_crossing_worker, initargs=(num_threads,)) as executor:
+        list(executor.map(process_crossing, crossing_paths))
 
 
 # =========================
 # Main Combined Process
 # =========================
 def main():
+    # routeSignal.csv is parsed once and drives both steps below
+    routes = load_routes(ROUTE_SIGNAL_FILE)
+
     # Step 1: Process lanes for crossings in routeSignal.csv
-    crossings_to_process = get_crossings_from_route_signal(ROUTE_SIGNAL_FILE)
+    crossings_to_process = sorted({f"Crossing_{s}" for route in routes for s in route["signals"]})
     if not crossings_to_process:
         print("⚠ No crossings to process. Exiting.", file=sys.stderr)
         out = {"fastest_route": None, "message": "No crossings to process", "routes": []}
@@ -230,31 +223,15 @@ def main():
 
     print(f"📌 Processing crossings: {', '.join(crossings_to_process)}", file=sys.stderr)
     if os.path.isdir(ALL_CROSSINGS_DIR):
+        crossing_paths = []
         for crossing_folder in sorted(os.listdir(ALL_CROSSINGS_DIR)):
             if crossing_folder in crossings_to_process:
                 crossing_path = os.path.join(ALL_CROSSINGS_DIR, crossing_folder)
                 if os.path.isdir(crossing_path) and "Lanes" in os.listdir(crossing_path):
-                    process_crossing(crossing_path)
+                    crossing_paths.append(crossing_path)
+        process_crossings(crossing_paths)
 
     # Step 2: Calculate total route times for all candidate routes
-    routes = []
-    try:
-        with open(ROUTE_SIGNAL_FILE, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                route_name = row['route'].strip().strip('"')
-                signals_str = (row.get('signal_serial_numbers') or "").strip().strip('"')
-                signals = [s.strip() for s in signals_str.split(';') if s.strip()]
-                distance_time_str = (row.get('distance_time') or "").strip().strip('"')
-                distance_seconds = parse_distance_time(distance_time_str)
-                routes.append({
-                    "name": route_name,
-                    "signals": signals,
-                    "distance_seconds": distance_seconds
-                })
-    except Exception as e:
-        print(f"[Error] reading {ROUTE_SIGNAL_FILE}: {e}", file=sys.stderr)
-
     summary_rows = []
     results = []
 
@@ -269,8 +246,7 @@ def main():
                 print(f"[Warning] lane_counts.csv not found for {crossing_folder}", file=sys.stderr)
                 continue
 
-            lane_data = read_lane_data(lane_counts_path)
-            lane1_time = calculate_lane1_time(lane_data)
+            lane1_time = get_lane1_time(lane_counts_path)
             signal_delays.append(lane1_time)
             route_total_time += lane1_time
             summary_rows.append({
@@ -2,9 +2,10 @@ import asyncio
 import csv
 import json
 import os
-import subprocess
 import websockets
 
+import traffic
+
 SIGNAL_CSV = "signal.csv"
 ALL_CROSSINGS_DIR = "All_Crossings"
 
@@ -23,27 +24,16 @@ async def read_csv():
             })
     return signals
 
-async def run_traffic(crossing_id, crossing_name):
-    proc = await asyncio.create_subprocess_exec(
-        "python", "traffic.py", crossing_name,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
+async def run_traffic(crossing_id, crossing_name, model):
+    async def send(data):
+        update = {
+            "type": "signal_update",
+            "signal_id": crossing_id,
+            "data": data
+        }
+        await broadcast(json.dumps(update))
 
-    async for line in proc.stdout:
-        try:
-            line = line.decode().strip()
-            if not line:
-                continue
-            data = json.loads(line)
-            update = {
-                "type": "signal_update",
-                "signal_id": crossing_id,
-                "data": data
-            }
-            await broadcast(json.dumps(update))
-        except json.JSONDecodeError:
-            continue  # ignore malformed lines
+    await traffic.supervise_traffic(crossing_name, model, send)
 
 async def broadcast(message):
     for ws in list(clients):
@@ -62,8 +52,10 @@ async def ws_handler(websocket):
 
 async def main():
     signals = await read_csv()
+    # One YOLO model shared by every crossing instead of a traffic.py process each
+    model = traffic.load_model()
     for s in signals:
-        asyncio.create_task(run_traffic(s["id"], s["crossing"]))
+        asyncio.create_task(run_traffic(s["id"], s["crossing"], model))
     
     async with websockets.serve(ws_handler, "0.0.0.0", 8765):
         await asyncio.Future()  # run forever
@@ -1,84 +1,20 @@
 import os
 import csv
-import re
 
-# Constants
-MAX_SIGNAL_TIME = 60
-BUFFER_TIME = 5
-MIN_GREEN_TIME = 5  # Minimum green signal required for fairness
+from traffic_core import get_lane1_time, load_routes
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 ALL_CROSSINGS_DIR = os.path.join(BASE_DIR, "All_Crossings")
 ROUTE_SIGNAL_FILE = os.path.join(BASE_DIR, "routeSignal.csv")
 SUMMARY_OUTPUT = os.path.join(BASE_DIR, "lane1_summary.csv")
 
-# --- Helper functions ---
-def read_lane_data(file_path):
-    """Read lane_counts.csv and return {lane_name: signal_time}"""
-    lane_data = {}
-    with open(file_path, 'r') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            lane_name = row['Lane'].replace('.jpg', '').replace('.png', '')
-            signal_time = int(row['Signal Time (s)'])
-            lane_data[lane_name] = signal_time
-    return lane_data
-
-def calculate_lane1_time(lane_data):
-    """Calculate total green time for Lane1 considering cycle rules"""
-    lane1_time = lane_data.get("lane1", 0)
-    lanes = sorted(lane_data.keys())
-    other_lanes = {lane: lane_data[lane] for lane in lanes if lane != "lane1"}
-
-    total_time = 0
-    remaining_lane1 = lane1_time
-    remaining_others = other_lanes.copy()
-
-    while remaining_lane1 > MAX_SIGNAL_TIME:
-        total_time += MAX_SIGNAL_TIME
-        remaining_lane1 -= MAX_SIGNAL_TIME
-        total_time += BUFFER_TIME
-
-        for lane in remaining_others:
-            time = min(remaining_others[lane], MAX_SIGNAL_TIME)
-            if time <= 0:
-                time = MIN_GREEN_TIME
-            total_time += time + BUFFER_TIME
-            remaining_others[lane] = max(0, remaining_others[lane] - time)
-
-    if remaining_lane1 > 0:
-        total_time += remaining_lane1
-
-    return total_time
-
-def parse_distance_time(distance_time_str):
-    """Extract time in seconds from 'X km / Y min' format"""
-    match = re.search(r'([\d\.]+)\s*min', distance_time_str)
-    if match:
-        return float(match.group(1)) * 60
-    return 0
-
 # --- Main processing ---
 def process_routes():
     if not os.path.exists(ROUTE_SIGNAL_FILE):
         print(f"[Error] routeSignal.csv not found: {ROUTE_SIGNAL_FILE}")
         return
 
-    # Read routeSignal.csv
-    routes = []
-    with open(ROUTE_SIGNAL_FILE, 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            route_name = row['route'].strip('"')
-            signals_str = row['signal_serial_numbers'].strip('"')
-            signals = [s.strip() for s in signals_str.split(';') if s.strip()]
-            distance_time_str = row['distance_time'].strip('"')
-            distance_seconds = parse_distance_time(distance_time_str)
-            routes.append({
-                "name": route_name,
-                "signals": signals,
-                "distance_seconds": distance_seconds
-            })
+    routes = load_routes(ROUTE_SIGNAL_FILE)
 
     summary_rows = []
     results = []
@@ -93,8 +29,7 @@ def process_routes():
                 print(f"[Warning] lane_counts.csv not found for {crossing_folder}")
                 continue
 
-            lane_data = read_lane_data(lane_counts_path)
-            lane1_time = calculate_lane1_time(lane_data)
+            lane1_time = get_lane1_time(lane_counts_path)
             route_total_time += lane1_time
             summary_rows.append({
                 "route": route["name"],
@@ -1,17 +1,17 @@
 import os
 import sys
-import time
 import json
+import asyncio
+import threading
 from datetime import datetime
 
+from traffic_core import count_vehicles, get_vehicle_ids
+
 SECONDS_PER_VEHICLE = 2.5
 MIN_GREEN_TIME = 5
 MAX_GREEN_TIME = 60
 YELLOW_BUFFER = 5
-
-VEHICLE_CLASSES = {
-    "car", "truck", "bus", "motorcycle", "motorbike", "bicycle", "van", "auto", "autorickshaw"
-}
+RESTART_DELAY = 5  # seconds before a crossing's controller is restarted after an error
 
 MODEL_CANDIDATES = ["yolov8n.pt", "yolov8m.pt", "yolov8s.pt"]
 
@@ -21,10 +21,7 @@ def pick_model_path():
             return m
     raise FileNotFoundError("No YOLO model found.")
 
-def resolve_lanes_dir():
-    if len(sys.argv) < 2:
-        raise ValueError("Crossing name/number required.")
-    crossing_name = sys.argv[1]
+def resolve_lanes_dir(crossing_name):
     lanes_path = os.path.join("All_Crossings", crossing_name, "Lanes")
     if not os.path.isdir(lanes_path):
         raise FileNotFoundError(f"No lanes folder: {lanes_path}")
@@ -51,74 +48,112 @@ def load_model():
     from ultralytics import YOLO
     return YOLO(model_path)
 
-def count_vehicles(model, image_path):
-    results = model(image_path, verbose=False)
-    count = 0
-    for r in results:
-        names = getattr(r, "names", None) or getattr(model, "names", {})
-        if r.boxes is None or r.boxes.cls is None:
-            continue
-        for c in r.boxes.cls.tolist():
-            cls_name = names.get(int(c), str(int(c)))
-            if cls_name in VEHICLE_CLASSES:
-                count += 1
-    return count
+# One model is shared by every crossing in the process, and Ultralytics
+# predictors are not thread-safe, so inference calls are serialized.
+_inference_lock = threading.Lock()
+
+def count_lane_vehicles(model, image_paths, vehicle_ids=None):
+    """Score several lane images in one batched inference; returns one count per image."""
+    if vehicle_ids is None:
+        vehicle_ids = get_vehicle_ids(model)
+    # Restricting predict to vehicle classes lets NMS discard everything else,
+    # so the boxes left in each result are exactly the vehicles
+    with _inference_lock:
+        # batch= makes this one forward pass (predict defaults to batch=1 for file sources)
+        results = model(image_paths, classes=vehicle_ids, batch=len(image_paths), verbose=False)
+    # Ultralytics sorts the sources and makes them absolute, so match results by path, not position
+    counts = {os.path.abspath(r.path): count_vehicles([r]) for r in results}
+    return [counts.get(os.path.abspath(p), 0) for p in image_paths]
 
 def green_time_from_count(n):
     t = int(n * SECONDS_PER_VEHICLE)
     return max(MIN_GREEN_TIME, min(t, MAX_GREEN_TIME))
 
-def run_traffic_controller():
-    lanes_dir = resolve_lanes_dir()
+async def run_traffic(crossing_name, model, send):
+    """Run the signal cycle for one crossing, passing each state update to `send`."""
+    lanes_dir = resolve_lanes_dir(crossing_name)
     lanes = discover_lanes(lanes_dir)
     if len(lanes) < 2:
         raise RuntimeError("Need at least 2 lanes.")
 
-    model = load_model()
+    lane_images = [img for _, img in lanes]
+    vehicle_ids = get_vehicle_ids(model)
     current_idx = 0
-    pre_scanned = None
+    # All lanes are scored in one batch per cycle, then re-scored before the cycle restarts
+    counts = await asyncio.to_thread(count_lane_vehicles, model, lane_images, vehicle_ids)
 
     while True:
-        lane_name, lane_img = lanes[current_idx]
-
-        if pre_scanned and pre_scanned.get("idx") == current_idx:
-            vehicle_count = pre_scanned.get("count", 0)
-            pre_scanned = None
-        else:
-            vehicle_count = count_vehicles(model, lane_img)
+        lane_name = lanes[current_idx][0]
+        vehicle_count = counts[current_idx]
 
         green_time = green_time_from_count(vehicle_count)
         timestamp = datetime.now().isoformat()
 
         # Send GREEN state update
-        print(json.dumps({
+        await send({
             "state": "GREEN",
             "current_lane": lane_name,
             "vehicle_count": vehicle_count,
             "green_time": green_time,
             "remaining_time": green_time,
             "timestamp": timestamp
-        }), flush=True)
+        })
 
-        time.sleep(green_time)
+        await asyncio.sleep(green_time)
 
         next_idx = (current_idx + 1) % len(lanes)
-        next_lane_name, next_lane_img = lanes[next_idx]
-        next_count = count_vehicles(model, next_lane_img)
-        pre_scanned = {"idx": next_idx, "count": next_count}
+        next_lane_name = lanes[next_idx][0]
+        if next_idx == 0:
+            counts = await asyncio.to_thread(count_lane_vehicles, model, lane_images, vehicle_ids)
 
         # Send YELLOW state update
-        print(json.dumps({
+        await send({
             "state": "YELLOW",
             "current_lane": lane_name,
             "next_lane": next_lane_name,
             "vehicle_count": vehicle_count,
             "yellow_time": YELLOW_BUFFER,
             "timestamp": datetime.now().isoformat()
-        }), flush=True)
+        })
 
-        time.sleep(YELLOW_BUFFER)
+        await asyncio.sleep(YELLOW_BUFFER)
         current_idx = next_idx
 
+async def supervise_traffic(crossing_name, model, send):
+    """Keep run_traffic going for one crossing, restarting it after transient errors."""
+    # A missing Lanes folder or too few lanes won't fix itself, so those end this crossing
+    try:
+        lanes = discover_lanes(resolve_lanes_dir(crossing_name))
+    except FileNotFoundError as e:
+        print(f"[Error] {crossing_name}: {e}", file=sys.stderr, flush=True)
+        return
+    if len(lanes) < 2:
+        print(f"[Error] {crossing_name}: Need at least 2 lanes.", file=sys.stderr, flush=True)
+        return
+
+    while True:
+        try:
+            await run_traffic(crossing_name, model, send)
+        except Exception as e:
+            print(f"[Error] {crossing_name}: {e}; restarting in {RESTART_DELAY}s", file=sys.stderr, flush=True)
+            await asyncio.sleep(RESTART_DELAY)
+
+async def run_crossings(crossing_names, model):
+    """Drive every crossing's signal cycle on one event loop, sharing one model."""
+    async def run_crossing(crossing_name):
+        async def send(data):
+            print(json.dumps({"crossing": crossing_name, **data}), flush=True)
+
+        await supervise_traffic(crossing_name, model, send)
+
+    await asyncio.gather(*(run_crossing(name) for name in crossing_names))
+
+def run_traffic_controller():
+    if len(sys.argv) < 2:
+        raise ValueError("Crossing name/number required.")
+
+    model = load_model()
+    asyncio.run(run_crossings(sys.argv[1:], model))
+
 if __name__ == "__main__":
     run_traffic_controller()
\ No newline at end of file
@@ -0,0 +1,129 @@
+# traffic_core.py
+# Helpers shared by mainAlgo.py, traffic.py and total_route_timer.py. Kept free of
+# torch/ultralytics imports so loading it stays cheap; callers pass in their model.
+import csv
+import os
+import re
+import sys
+
+# =========================
+# Constants for Route Timing
+# =========================
+MAX_SIGNAL_TIME = 60
+BUFFER_TIME = 5
+MIN_GREEN_TIME = 5  # Minimum green signal for fairness
+
+# =========================
+# Vehicle detection
+# =========================
+VEHICLE_CLASSES = {
+    "car", "truck", "bus", "motorcycle", "motorbike", "bicycle", "van", "auto", "autorickshaw"
+}
+
+
+def get_vehicle_ids(model):
+    """Class ids of VEHICLE_CLASSES in the model's label map, for predict(classes=...)."""
+    return [i for i, name in getattr(model, "names", {}).items() if name in VEHICLE_CLASSES]
+
+
+def count_vehicles(results):
+    """Count vehicles in results from a predict call run with classes=get_vehicle_ids(model)."""
+    # NMS already dropped every other class, so each remaining box is a vehicle
+    return sum(len(r.boxes) for r in results if r.boxes is not None)
+
+
+def resolve_weights(model_path, engine_env):
+    """Prefer an exported TensorRT/ONNX engine (env var `engine_env`, or next to model_path) over the .pt weights."""
+    # Each script passes its own env var so an export of one model is never loaded by another
+    engine_path = os.getenv(engine_env, os.path.splitext(model_path)[0] + ".engine")
+    return engine_path if os.path.exists(engine_path) else model_path
+
+
+# =========================
+# Route Timer Helper Functions
+# =========================
+def read_lane_data(file_path):
+    """Read lane_counts.csv and return {lane_name: signal_time}"""
+    # lane_counts.csv holds at most a handful of rows, so csv beats any bulk reader here
+    lane_data = {}
+    try:
+        with open(file_path, 'r', newline='') as file:
+            for row in csv.DictReader(file):
+                lane_name = re.sub(r'\.(jpg|jpeg|png)$', '', row.get('Lane') or '', flags=re.IGNORECASE).lower()
+                try:
+                    signal_time = int(float(row.get('Signal Time (s)') or 0))
+                except ValueError:
+                    signal_time = 0
+                lane_data[lane_name] = signal_time
+    except Exception as e:
+        print(f"[Warning] could not read lane data at {file_path}: {e}", file=sys.stderr)
+        return {}
+    return lane_data
+
+
+def calculate_lane1_time(lane_data):
+    """Calculate total green time for Lane1 considering cycle rules"""
+    lane1_time = lane_data.get("lane1", 0)
+
+    # Lane1 runs full MAX_SIGNAL_TIME cycles while more than MAX_SIGNAL_TIME remains;
+    # each of those cycles also lets every other lane take its turn.
+    cycles = max(0, -(-lane1_time // MAX_SIGNAL_TIME) - 1)
+    total_time = cycles * (MAX_SIGNAL_TIME + BUFFER_TIME)
+    total_time += max(0, lane1_time - cycles * MAX_SIGNAL_TIME)
+
+    for lane, time in lane_data.items():
+        if lane == "lane1":
+            continue
+        # A lane gets up to MAX_SIGNAL_TIME per turn until drained, then MIN_GREEN_TIME
+        remaining = max(0, time)
+        green_cycles = min(cycles, -(-remaining // MAX_SIGNAL_TIME))
+        total_time += min(remaining, green_cycles * MAX_SIGNAL_TIME)
+        total_time += (cycles - green_cycles) * MIN_GREEN_TIME + cycles * BUFFER_TIME
+
+    return total_time
+
+
+# {(lane_counts_path, mtime): lane1_time}; routes often share crossings, and a
+# rewritten lane_counts.csv gets a new mtime so stale entries are never hit
+_lane1_cache = {}
+
+
+def get_lane1_time(lane_counts_path):
+    """Cached read_lane_data + calculate_lane1_time for one crossing's lane_counts.csv"""
+    key = (lane_counts_path, os.path.getmtime(lane_counts_path))
+    if key not in _lane1_cache:
+        _lane1_cache[key] = calculate_lane1_time(read_lane_data(lane_counts_path))
+    return _lane1_cache[key]
+
+
+def parse_distance_time(distance_time_str):
+    """Extract time in seconds from 'X km / Y min' format"""
+    if not distance_time_str:
+        return 0
+    match = re.search(r'([\d\.]+)\s*min', distance_time_str)
+    if match:
+        try:
+            return float(match.group(1)) * 60.0
+        except Exception:
+            return 0
+    return 0
+
+
+def load_routes(csv_path):
+    """Parse routeSignal.csv once into [{name, signals, distance_seconds}]"""
+    routes = []
+    try:
+        with open(csv_path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                route_name = (row.get('route') or "").strip().strip('"')
+                signals_str = (row.get('signal_serial_numbers') or "").strip().strip('"')
+                signals = [s.strip() for s in signals_str.split(';') if s.strip()]
+                distance_time_str = (row.get('distance_time') or "").strip().strip('"')
+                routes.append({
+                    "name": route_name,
+                    "signals": signals,
+                    "distance_seconds": parse_distance_time(distance_time_str)
+                })
+    except Exception as e:
+        print(f"[Error] reading {csv_path}: {e}", file=sys.stderr)
+    return routes
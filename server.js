@@ -29,10 +29,11 @@ const server = http.createServer(app);
 const PORT = process.env.PORT || 3000;
 const JWT_SECRET = process.env.JWT_SECRET || 'dev_secret';
 const PYTHON_PATH = process.env.PYTHON_PATH || 'python';
+const DETECT_ACCIDENT_URL = process.env.DETECT_ACCIDENT_URL || '';
 
 // Create WebSocket server for traffic signals
 const wss = new WebSocket.Server({ server });
-const pythonProcesses = new Map();
+let trafficController = null;
 
 // Configure multer for file uploads
 const upload = multer({ dest: path.join(__dirname, 'public', 'Incident_mapping', 'uploads') });
@@ -337,65 +338,73 @@ function parseDMS(coord) {
   return dd;
 }
 
-function startTrafficSignalProcess(signal) {
-  const crossingName = `Crossing_${signal.SL_No}`;
+function startTrafficController(signals) {
   const pythonDir = path.join(__dirname, 'python');
-  
-  // Check if crossing directory exists
-  const crossingPath = path.join(pythonDir, 'All_Crossings', crossingName);
-  if (!fs.existsSync(crossingPath)) {
-    console.warn(`Crossing directory not found: ${crossingPath}`);
-    return null;
-  }
-  
-  // Start the traffic.py process for this signal
-  const trafficProcess = spawn(PYTHON_PATH, ['traffic.py', crossingName], {
+
+  // Only signals whose crossing directory exists get a controller
+  const signalsByCrossing = new Map();
+  signals.forEach(signal => {
+    const crossingName = `Crossing_${signal.SL_No}`;
+    const crossingPath = path.join(pythonDir, 'All_Crossings', crossingName);
+    if (!fs.existsSync(crossingPath)) {
+      console.warn(`Crossing directory not found: ${crossingPath}`);
+      return;
+    }
+    signalsByCrossing.set(crossingName, signal);
+  });
+  if (signalsByCrossing.size === 0) return null;
+
+  // A single traffic.py drives every crossing on one event loop with one shared YOLO model;
+  // each output line is tagged with the crossing it belongs to
+  const trafficProcess = spawn(PYTHON_PATH, ['traffic.py', ...signalsByCrossing.keys()], {
     cwd: pythonDir,
     stdio: ['pipe', 'pipe', 'pipe']
   });
-  
+
+  let buffer = '';
   trafficProcess.stdout.on('data', (data) => {
-    try {
-      const lines = data.toString().split('\n');
-      lines.forEach(line => {
-        if (line.trim()) {
-          try {
-            const signalData = JSON.parse(line);
-            // Broadcast to all connected WebSocket clients
-            const message = JSON.stringify({
-              type: 'signal_update',
-              signal_id: signal.SL_No,
-              data: signalData
-            });
-            
-            wss.clients.forEach(client => {
-              if (client.readyState === WebSocket.OPEN) {
-                client.send(message);
-              }
-            });
-          } catch (e) {
-            console.error('Error parsing traffic signal data:', e, line);
+    buffer += data.toString();
+    const lines = buffer.split('\n');
+    buffer = lines.pop();
+    lines.forEach(line => {
+      if (!line.trim()) return;
+      try {
+        const { crossing, ...signalData } = JSON.parse(line);
+        const signal = signalsByCrossing.get(crossing);
+        if (!signal) return;
+
+        // Broadcast to all connected WebSocket clients
+        const message = JSON.stringify({
+          type: 'signal_update',
+          signal_id: signal.SL_No,
+          data: signalData
+        });
+
+        wss.clients.forEach(client => {
+          if (client.readyState === WebSocket.OPEN) {
+            client.send(message);
           }
-        }
-      });
-    } catch (e) {
-      console.error('Error processing traffic signal output:', e);
-    }
+        });
+      } catch (e) {
+        console.error('Error parsing traffic signal data:', e, line);
+      }
+    });
   });
-  
+
   trafficProcess.stderr.on('data', (data) => {
-    console.error(`Traffic signal ${signal.SL_No} error: ${data}`);
+    console.error(`Traffic controller error: ${data}`);
   });
-  
+
   trafficProcess.on('close', (code) => {
-    console.log(`Traffic signal ${signal.SL_No} process exited with code ${code}`);
-    // Restart the process after a delay
+    console.log(`Traffic controller exited with code ${code}`);
+    // Restart the controller after a delay
     setTimeout(() => {
-      console.log(`Restarting traffic signal ${signal.SL_No}`);
-      pythonProcesses.set(signal.SL_No, startTrafficSignalProcess(signal));
+      console.log('Restarting traffic controller');
+      trafficController = startTrafficController(signals);
     }, 5000);
   });
-  
+
+  trafficProcess.signalCount = signalsByCrossing.size;
   return trafficProcess;
 }
 
@@ -473,6 +482,101 @@ function containsAccidentWords(text) {
   return accidentKeywords.some(word => lowerText.includes(word));
 }
 
+// Single long-lived detect_accident.py worker so the YOLO model is loaded once,
+// not on every incident report. Requests are answered in order, one JSON line each.
+const detectDir = path.join(__dirname, 'python');
+const detectScriptPath = path.join(detectDir, 'detect_accident.py');
+const DETECT_TIMEOUT_MS = parseInt(process.env.DETECT_TIMEOUT_MS || '60000', 10);
+let detectWorker = null;
+
+function getDetectWorker() {
+  if (detectWorker) return detectWorker;
+
+  // Run from python/ so the model weights/engines resolve next to the script
+  const worker = spawn(PYTHON_PATH, [detectScriptPath, '--serve'], { cwd: detectDir, env: { ...process.env } });
+  worker.pendingDetections = [];
+  let buffer = '';
+
+  worker.stdout.on('data', (data) => {
+    buffer += data.toString();
+    let newline;
+    while ((newline = buffer.indexOf('\n')) >= 0) {
+      const line = buffer.slice(0, newline).trim();
+      buffer = buffer.slice(newline + 1);
+      if (!line.startsWith('{')) continue; // ignore stray library output
+
+      const pending = worker.pendingDetections.shift();
+      if (!pending) continue;
+      try {
+        pending.resolve(JSON.parse(line));
+      } catch (e) {
+        pending.reject(e);
+      }
+    }
+  });
+
+  worker.stderr.on('data', (data) => {
+    console.error(`Accident detection worker: ${data}`);
+  });
+
+  // Writes to a worker that is being killed must not crash the server
+  worker.stdin.on('error', (err) => {
+    console.error('Accident detection worker stdin error:', err.message);
+  });
+
+  worker.on('close', (code) => {
+    console.log(`Accident detection worker exited with code ${code}`);
+    if (detectWorker === worker) detectWorker = null;
+    while (worker.pendingDetections.length) {
+      worker.pendingDetections.shift().reject(new Error(`Detection worker exited with code ${code}`));
+    }
+  });
+
+  detectWorker = worker;
+  return worker;
+}
+
+async function detectAccidentViaHttp(imgPath) {
+  const controller = new AbortController();
+  const timer = setTimeout(() => controller.abort(), DETECT_TIMEOUT_MS);
+  try {
+    const response = await fetch(DETECT_ACCIDENT_URL, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ path: imgPath }),
+      signal: controller.signal
+    });
+    return await response.json();
+  } finally {
+    clearTimeout(timer);
+  }
+}
+
+function detectAccidentInImage(imgPath) {
+  // Prefer the standalone detect_accident_server.py when one is configured
+  if (DETECT_ACCIDENT_URL) return detectAccidentViaHttp(imgPath);
+
+  return new Promise((resolve, reject) => {
+    const worker = getDetectWorker();
+    let timer = null;
+    const settle = (fn) => (value) => {
+      clearTimeout(timer);
+      fn(value);
+    };
+    worker.pendingDetections.push({ resolve: settle(resolve), reject: settle(reject) });
+
+    // Answers come back strictly in order, so a hung request would block every
+    // one queued behind it: fail it and replace the worker (close rejects the rest)
+    timer = setTimeout(() => {
+      reject(new Error(`Accident detection timed out after ${DETECT_TIMEOUT_MS} ms`));
+      if (detectWorker === worker) detectWorker = null;
+      worker.kill('SIGKILL');
+    }, DETECT_TIMEOUT_MS);
+
+    worker.stdin.write(`${imgPath}\n`);
+  });
+}
+
 async function reverseGeocode(location) {
   try {
     if (!location) return null;
@@ -575,19 +679,11 @@ app.post('/api/incident/report', authRequired, upload.single("file"), async (req
       console.log("Image received, running YOLO detection...");
       try {
         const imgPath = path.resolve(req.file.path);
-        const detectScriptPath = path.join(__dirname, 'public', 'Incident_mapping', 'detect_accident.py');
-        const py = spawn("python", [detectScriptPath, imgPath], { env: { ...process.env } });
-
-        let stdout = "", stderr = "";
-        py.stdout.on("data", (data) => { stdout += data.toString(); });
-        py.stderr.on("data", (data) => { stderr += data.toString(); });
-
-        const exitCode = await new Promise((resolve) => py.on("close", resolve));
-        if (exitCode !== 0) {
-          return res.status(500).json({ status: "Error in image detection", error: stderr || stdout });
+        const result = await detectAccidentInImage(imgPath);
+        if (result.error) {
+          return res.status(500).json({ status: "Error in image detection", error: JSON.stringify(result) });
         }
 
-        let result = JSON.parse(stdout);
         if (result.accident) {
           alertTriggered = true;
           detectionReason = result.info.reason;
@@ -921,15 +1017,13 @@ app.get('*', (req, res) => {
     ensureFilesWithDefaults();
   }
 
-  // Start traffic signal processes
+  // Start the traffic signal controller
   const signals = await readSignalCSV();
-  signals.forEach(signal => {
-    pythonProcesses.set(signal.SL_No, startTrafficSignalProcess(signal));
-  });
+  trafficController = startTrafficController(signals);
 
   server.listen(PORT, () => {
     console.log(`Server listening on http://localhost:${PORT}`);
     console.log(`WebSocket server running on ws://localhost:${PORT}`);
-    console.log(`Started ${pythonProcesses.size} traffic signal processes`);
+    console.log(`Started traffic controller for ${trafficController ? trafficController.signalCount : 0} signals`);
   });
 })();
\ No newline at end of file